@@ -3,13 +3,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 import pandas as pd
-import io
 import os
 from typing import Dict, Any
 import json
 
 from analysis import perform_statistical_analysis
 from pdf_generator import generate_pdf_report
+from uploads import UploadSizeLimitMiddleware, open_excel_upload
+from versioning import validate_dataset_name, update_dataset, get_dataset_summary
 
 app = FastAPI(title="Statly API", description="API for statistical analysis of Excel files")
 
@@ -17,6 +18,10 @@ app = FastAPI(title="Statly API", description="API for statistical analysis of E
 frontend_dir = os.path.join(os.path.dirname(__file__), "../frontend")
 app.mount("/static", StaticFiles(directory=frontend_dir), name="static")
 
+# Limita la dimensione degli upload durante lo streaming del corpo.
+# Va registrato prima del CORS, così le risposte 413/400 hanno gli header CORS
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS per permettere al frontend di comunicare con il backend
 app.add_middleware(
     CORSMiddleware,
@@ -64,25 +69,25 @@ async def upload_excel_file(file: UploadFile = File(...)):
     
     try:
         # Leggi il file Excel
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Verifica che il file non sia vuoto
-        if df.empty:
-            raise HTTPException(status_code=400, detail="Il file Excel è vuoto")
-        
-        # Restituisci informazioni base sul dataset
-        return {
-            "success": True,
-            "filename": file.filename,
-            "rows": int(len(df)),
-            "columns": int(len(df.columns)),
-            "column_names": df.columns.tolist(),
-            "data_types": {col: str(dtype) for col, dtype in df.dtypes.items()},
-            "preview": df.head(5).fillna("").to_dict('records'),  # Prime 5 righe, sostituisce NaN con stringa vuota
-            "has_missing_values": bool(df.isnull().any().any())
-        }
+        async with open_excel_upload(file) as df:
+            # Verifica che il file non sia vuoto
+            if df.empty:
+                raise HTTPException(status_code=400, detail="Il file Excel è vuoto")
+            
+            # Restituisci informazioni base sul dataset
+            return {
+                "success": True,
+                "filename": file.filename,
+                "rows": int(len(df)),
+                "columns": int(len(df.columns)),
+                "column_names": df.columns.tolist(),
+                "data_types": {col: str(dtype) for col, dtype in df.dtypes.items()},
+                "preview": df.head(5).fillna("").to_dict('records'),  # Prime 5 righe, sostituisce NaN con stringa vuota
+                "has_missing_values": bool(df.isnull().any().any())
+            }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nel processare il file: {str(e)}")
 
@@ -96,14 +101,12 @@ async def analyze_data(file: UploadFile = File(...)):
     
     try:
         # Leggi il file Excel
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        if df.empty:
-            raise HTTPException(status_code=400, detail="Il file Excel è vuoto")
-        
-        # Esegui l'analisi statistica
-        analysis_results = perform_statistical_analysis(df)
+        async with open_excel_upload(file) as df:
+            if df.empty:
+                raise HTTPException(status_code=400, detail="Il file Excel è vuoto")
+            
+            # Esegui l'analisi statistica
+            analysis_results = perform_statistical_analysis(df)
         
         return {
             "success": True,
@@ -111,6 +114,8 @@ async def analyze_data(file: UploadFile = File(...)):
             "analysis": analysis_results
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nell'analisi: {str(e)}")
 
@@ -124,17 +129,15 @@ async def generate_report(file: UploadFile = File(...)):
     
     try:
         # Leggi il file Excel
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        if df.empty:
-            raise HTTPException(status_code=400, detail="Il file Excel è vuoto")
-        
-        # Esegui l'analisi
-        analysis_results = perform_statistical_analysis(df)
-        
-        # Genera il PDF
-        pdf_path = generate_pdf_report(df, analysis_results, file.filename)
+        async with open_excel_upload(file) as df:
+            if df.empty:
+                raise HTTPException(status_code=400, detail="Il file Excel è vuoto")
+            
+            # Esegui l'analisi
+            analysis_results = perform_statistical_analysis(df)
+            
+            # Genera il PDF
+            pdf_path = generate_pdf_report(df, analysis_results, file.filename)
         
         # Restituisci il file PDF
         return FileResponse(
@@ -143,9 +146,60 @@ async def generate_report(file: UploadFile = File(...)):
             filename=f"statly_report_{file.filename.split('.')[0]}.pdf"
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nella generazione del report: {str(e)}")
 
+@app.post("/api/datasets/{dataset_name}/versions")
+async def upload_dataset_version(dataset_name: str, file: UploadFile = File(...)):
+    """
+    Endpoint per caricare una nuova versione di un dataset: aggiorna le statistiche
+    in modo incrementale e restituisce il confronto con la versione precedente
+    """
+    if not validate_dataset_name(dataset_name):
+        raise HTTPException(status_code=400, detail="Nome del dataset non valido (usa lettere, numeri, '-' e '_')")
+
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        raise HTTPException(status_code=400, detail="File deve essere Excel (.xlsx o .xls)")
+    
+    try:
+        # Leggi il file Excel
+        async with open_excel_upload(file) as df:
+            if df.empty:
+                raise HTTPException(status_code=400, detail="Il file Excel è vuoto")
+            
+            # Aggiorna lo stato aggregato del dataset
+            version_results = update_dataset(dataset_name, df)
+        
+        return {
+            "success": True,
+            "filename": file.filename,
+            **version_results
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore nell'aggiornamento del dataset: {str(e)}")
+
+@app.get("/api/datasets/{dataset_name}")
+async def get_dataset(dataset_name: str):
+    """
+    Endpoint per ottenere le statistiche dell'ultima versione di un dataset
+    """
+    if not validate_dataset_name(dataset_name):
+        raise HTTPException(status_code=400, detail="Nome del dataset non valido (usa lettere, numeri, '-' e '_')")
+    
+    summary = get_dataset_summary(dataset_name)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Dataset non trovato")
+    
+    return {
+        "success": True,
+        **summary
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# I moduli del backend vengono importati senza package (es. `from analysis import ...`)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
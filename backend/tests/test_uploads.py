@@ -0,0 +1,159 @@
+import asyncio
+import io
+
+import pandas as pd
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+import uploads
+from main import app
+from uploads import MemoryBudget, UploadSizeLimitMiddleware, open_excel_upload
+
+LIMIT = 1024
+
+
+def make_limited_client() -> TestClient:
+    limited_app = FastAPI()
+    limited_app.add_middleware(UploadSizeLimitMiddleware, max_body_size=LIMIT)
+
+    @limited_app.post("/api/analyze")
+    async def analyze(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(limited_app)
+
+
+def excel_bytes(rows: int) -> bytes:
+    buffer = io.BytesIO()
+    pd.DataFrame({"peso": range(rows), "esercizio": ["Panca"] * rows}).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def test_upload_under_limit_is_accepted():
+    response = make_limited_client().post("/api/analyze", files={"file": ("dati.xlsx", b"x" * 100)})
+
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_content_length_over_limit_is_rejected_early():
+    response = make_limited_client().post(
+        "/api/analyze",
+        content=b"x",
+        headers={
+            "content-length": str(LIMIT + 1),
+            "content-type": "multipart/form-data; boundary=statly"
+        }
+    )
+
+    assert response.status_code == 413
+    assert "File troppo grande" in response.json()['detail']
+
+
+def test_streamed_body_over_limit_is_rejected():
+    def chunks():
+        body = (
+            b"--statly\r\n"
+            b'Content-Disposition: form-data; name="file"; filename="dati.xlsx"\r\n\r\n'
+            + b"x" * (4 * LIMIT)
+            + b"\r\n--statly--\r\n"
+        )
+        for start in range(0, len(body), 256):
+            yield body[start:start + 256]
+
+    # Senza Content-Length il corpo viene inviato a chunk e contato durante lo streaming
+    response = make_limited_client().post(
+        "/api/analyze",
+        content=chunks(),
+        headers={"content-type": "multipart/form-data; boundary=statly"}
+    )
+
+    assert response.status_code == 413
+    assert "File troppo grande" in response.json()['detail']
+
+
+def test_size_limit_response_has_cors_headers():
+    client = TestClient(app)
+    response = client.post(
+        "/api/analyze",
+        content=b"x",
+        headers={
+            "content-length": str(10 ** 12),
+            "content-type": "multipart/form-data; boundary=statly",
+            "origin": "http://example.com"
+        }
+    )
+
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == "*"
+
+
+def test_memory_budget_timeout_returns_503():
+    async def scenario():
+        budget = MemoryBudget(100)
+        await budget.acquire(80)
+        with pytest.raises(HTTPException) as exc_info:
+            await budget.acquire(30, timeout=0.01)
+        return budget, exc_info.value
+
+    budget, error = asyncio.run(scenario())
+
+    assert error.status_code == 503
+    assert budget.in_use == 80
+
+
+def test_memory_budget_rejects_requests_over_capacity():
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(MemoryBudget(100).acquire(101))
+
+    assert exc_info.value.status_code == 413
+
+
+def test_memory_budget_release_and_resize_accounting():
+    async def scenario():
+        budget = MemoryBudget(100)
+        await budget.acquire(90)
+
+        # Un ridimensionamento verso il basso sblocca chi è in attesa
+        waiter = asyncio.create_task(budget.acquire(40, timeout=1))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        await budget.resize(90, 50)
+        await waiter
+        assert budget.in_use == 90
+
+        # Il ridimensionamento verso l'alto non attende e può superare la capacità
+        await budget.resize(50, 70)
+        assert budget.in_use == 110
+
+        await budget.release(70)
+        await budget.release(40)
+        return budget.in_use
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_open_excel_upload_reserves_measured_size(monkeypatch):
+    data = excel_bytes(200)
+    budget = MemoryBudget(100 * 1024 * 1024)
+    monkeypatch.setattr(uploads, "memory_budget", budget)
+
+    async def scenario():
+        file = UploadFile(io.BytesIO(data), size=len(data), filename="dati.xlsx")
+        async with open_excel_upload(file) as df:
+            in_use = budget.in_use
+            expected = len(data) + int(df.memory_usage(deep=True).sum())
+            rows = len(df)
+
+        with pytest.raises(RuntimeError):
+            async with open_excel_upload(UploadFile(io.BytesIO(data), size=len(data), filename="dati.xlsx")):
+                raise RuntimeError("errore durante l'analisi")
+
+        return rows, in_use, expected
+
+    rows, in_use, expected = asyncio.run(scenario())
+
+    assert rows == 200
+    assert in_use == expected
+    assert budget.in_use == 0
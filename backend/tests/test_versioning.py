@@ -0,0 +1,178 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import versioning
+from analysis import basic_statistics
+from versioning import update_dataset
+
+
+@pytest.fixture(autouse=True)
+def datasets_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(versioning, "DATASETS_DIR", str(tmp_path))
+
+
+def make_dataset(rows: int, seed: int, missing: bool = False) -> pd.DataFrame:
+    """
+    Stessi dtype prodotti da read_excel: `ripetizioni` è int64 finché non
+    contiene celle vuote, poi diventa float64
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "peso": rng.normal(1e6, 3, rows),
+        "ripetizioni": rng.integers(0, 100, rows),
+        "esercizio": rng.choice(["Panca", "Squat", "Stacco"], rows)
+    })
+    if missing:
+        df.loc[df.sample(frac=0.1, random_state=seed).index, "ripetizioni"] = np.nan
+    return df
+
+
+def assert_matches_basic_statistics(df: pd.DataFrame, stats: dict):
+    expected = basic_statistics(df)
+
+    assert stats['dataset_info']['total_rows'] == expected['dataset_info']['total_rows']
+    assert stats['dataset_info']['missing_values'] == expected['dataset_info']['missing_values']
+
+    for col, summary in expected['numeric_summary'].items():
+        for key, value in summary.items():
+            assert stats['numeric_summary'][col][key] == pytest.approx(value, rel=1e-9), (col, key)
+
+    for col1, row in expected['correlations'].items():
+        for col2, value in row.items():
+            assert stats['correlations'][col1][col2] == pytest.approx(value, abs=1e-8), (col1, col2)
+
+    for col, summary in expected['categorical_summary'].items():
+        assert stats['categorical_summary'][col]['unique_values'] == summary['unique_values']
+        assert stats['categorical_summary'][col]['most_frequent'] == summary['most_frequent']
+        assert stats['categorical_summary'][col]['value_counts'] == summary['value_counts']
+
+
+def test_appended_rows_match_basic_statistics():
+    base = make_dataset(500, seed=0)
+    first = update_dataset("palestra", base)
+    assert first['diff']['mode'] == 'initial'
+    assert_matches_basic_statistics(base, first['statistics'])
+
+    appended = pd.concat([base, make_dataset(50, seed=1, missing=True)], ignore_index=True)
+    assert base['ripetizioni'].dtype == np.int64
+    assert appended['ripetizioni'].dtype == np.float64
+    second = update_dataset("palestra", appended)
+
+    assert second['version'] == 2
+    assert second['diff']['mode'] == 'incremental'
+    assert second['diff']['appended_rows'] == 50
+    assert second['diff']['changed_rows'] == 0
+    assert_matches_basic_statistics(appended, second['statistics'])
+
+
+def test_integer_column_gaining_nan_stays_incremental():
+    first = pd.DataFrame({"rip": [5, 8, 10]})
+    update_dataset("palestra", first)
+
+    appended = pd.concat([first, pd.DataFrame({"rip": [np.nan]})], ignore_index=True)
+    result = update_dataset("palestra", appended)
+
+    assert result['diff']['mode'] == 'incremental'
+    assert result['diff']['appended_rows'] == 1
+    assert result['diff']['changed_rows'] == 0
+    assert result['diff']['changed_row_positions'] == []
+    assert result['statistics']['numeric_summary']['rip']['count'] == 3
+    assert result['statistics']['dataset_info']['missing_values'] == {"rip": 1}
+
+
+def test_most_frequent_matches_mode():
+    first = pd.DataFrame({"valore": [3, 1, 1, 3, "z"]})
+    update_dataset("misto", first)
+
+    appended = pd.concat([first, pd.DataFrame({"valore": ["z"]})], ignore_index=True)
+    result = update_dataset("misto", appended)
+    summary = result['statistics']['categorical_summary']['valore']
+
+    assert result['diff']['mode'] == 'incremental'
+    assert summary['most_frequent'] == basic_statistics(appended)['categorical_summary']['valore']['most_frequent']
+    assert summary['most_frequent'] == 1
+    assert isinstance(summary['most_frequent'], int)
+
+
+def test_edited_row_triggers_full_rebuild():
+    base = make_dataset(100, seed=0)
+    update_dataset("palestra", base)
+
+    edited = base.copy()
+    edited.loc[3, "peso"] = 0.0
+    result = update_dataset("palestra", edited)
+
+    assert result['diff']['mode'] == 'full'
+    assert result['diff']['changed_rows'] == 1
+    assert result['diff']['changed_row_positions'] == [3]
+    assert result['diff']['numeric_changes']['peso']['min']['after'] == 0.0
+    assert_matches_basic_statistics(edited, result['statistics'])
+
+
+def test_all_nan_column():
+    base = make_dataset(50, seed=0)
+    base["vuota"] = np.nan
+    update_dataset("palestra", base)
+
+    appended = pd.concat([base, make_dataset(10, seed=1).assign(vuota=np.nan)], ignore_index=True)
+    result = update_dataset("palestra", appended)
+    stats = result['statistics']
+
+    assert result['diff']['mode'] == 'incremental'
+    assert stats['numeric_summary']['vuota']['count'] == 0
+    assert stats['numeric_summary']['vuota']['mean'] is None
+    assert stats['numeric_summary']['vuota']['std'] is None
+    assert stats['numeric_summary']['vuota']['min'] is None
+    assert stats['correlations']['peso']['vuota'] is None
+    assert stats['dataset_info']['missing_values']['vuota'] == 60
+    assert stats['numeric_summary']['peso']['mean'] == pytest.approx(appended['peso'].mean(), rel=1e-12)
+
+
+def test_column_layout_change():
+    base = make_dataset(100, seed=0)
+    update_dataset("palestra", base)
+
+    changed = base.drop(columns=["ripetizioni"]).assign(serie=3.0)
+    result = update_dataset("palestra", changed)
+
+    assert result['diff']['mode'] == 'full'
+    assert result['diff']['added_columns'] == ["serie"]
+    assert result['diff']['removed_columns'] == ["ripetizioni"]
+    assert "ripetizioni" not in result['diff']['numeric_changes']
+    assert_matches_basic_statistics(changed, result['statistics'])
+
+
+def test_concurrent_updates_are_serialized(tmp_path):
+    base = make_dataset(20, seed=0)
+    versions = [base.iloc[:10 + i] for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda df: update_dataset("palestra", df), versions))
+
+    assert sorted(result['version'] for result in results) == list(range(1, 9))
+    assert versioning.get_dataset_summary("palestra")['version'] == 8
+    hashes_files = [f for f in os.listdir(tmp_path) if f.endswith(".npy")]
+    assert len(hashes_files) == 1
+    assert versioning.load_dataset_state("palestra")['consistent']
+
+
+def test_missing_fingerprints_report_unknown_row_changes(tmp_path):
+    base = make_dataset(30, seed=0)
+    update_dataset("palestra", base)
+    state = versioning.load_dataset_state("palestra")
+    os.remove(tmp_path / state['row_hashes_file'])
+
+    appended = pd.concat([base, make_dataset(5, seed=1)], ignore_index=True)
+    result = update_dataset("palestra", appended)
+
+    assert result['diff']['mode'] == 'full'
+    assert result['diff']['appended_rows'] is None
+    assert result['diff']['changed_rows'] is None
+    assert result['diff']['changed_row_positions'] is None
+    assert result['diff']['removed_rows'] is None
+    assert_matches_basic_statistics(appended, result['statistics'])
+    assert versioning.load_dataset_state("palestra")['consistent']
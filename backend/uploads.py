@@ -0,0 +1,158 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import pandas as pd
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Limiti configurabili tramite variabili d'ambiente
+MAX_UPLOAD_SIZE = int(os.environ.get("STATLY_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+MEMORY_BUDGET = int(os.environ.get("STATLY_MEMORY_BUDGET_MB", "512")) * 1024 * 1024
+ADMISSION_TIMEOUT = float(os.environ.get("STATLY_ADMISSION_TIMEOUT", "30"))
+# Stima della memoria del DataFrame rispetto alla dimensione del file (un .xlsx è compresso)
+DATAFRAME_EXPANSION_FACTOR = float(os.environ.get("STATLY_DATAFRAME_EXPANSION_FACTOR", "5"))
+
+# Margine per gli header multipart che accompagnano il file nel corpo della richiesta
+MULTIPART_OVERHEAD = 64 * 1024
+
+UPLOAD_PATHS = ("/api/upload-excel", "/api/analyze", "/api/generate-report", "/api/datasets/")
+
+
+def _too_large_detail() -> str:
+    return f"File troppo grande (massimo {MAX_UPLOAD_SIZE // (1024 * 1024)} MB)"
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Middleware ASGI che limita la dimensione del corpo delle richieste di upload.
+    Rifiuta subito le richieste con Content-Length eccessivo e interrompe lo
+    streaming del corpo appena viene superato il limite.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int = MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(UPLOAD_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        # Rifiuto anticipato tramite Content-Length
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                response = JSONResponse({"detail": "Content-Length non valido"}, status_code=400)
+                await response(scope, receive, send)
+                return
+            if declared > self.max_body_size:
+                response = JSONResponse({"detail": _too_large_detail()}, status_code=413)
+                await response(scope, receive, send)
+                return
+
+        # Conta i byte ricevuti durante lo streaming (anche per upload chunked).
+        # L'HTTPException sollevata qui viene propagata dal parser del form
+        # e trasformata in una risposta 413.
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(status_code=413, detail=_too_large_detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class MemoryBudget:
+    """
+    Controllo di ammissione: limita i byte (upload e DataFrame) in elaborazione
+    contemporaneamente tra tutte le richieste.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, nbytes: int, timeout: float = ADMISSION_TIMEOUT):
+        if nbytes > self.capacity:
+            raise HTTPException(status_code=413, detail="Il file richiede più memoria di quella disponibile sul server")
+
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.in_use + nbytes <= self.capacity),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="Server occupato, riprova tra qualche istante")
+            self.in_use += nbytes
+
+    async def release(self, nbytes: int):
+        async with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+    async def resize(self, old_nbytes: int, new_nbytes: int):
+        """
+        Corregge una prenotazione già ottenuta senza attendere: la memoria è già
+        allocata, quindi una stima troppo bassa può superare temporaneamente la capacità
+        """
+        async with self._condition:
+            self.in_use += new_nbytes - old_nbytes
+            self._condition.notify_all()
+
+
+memory_budget = MemoryBudget(MEMORY_BUDGET)
+
+
+def _upload_size(file: UploadFile) -> int:
+    """
+    Dimensione del file caricato, già salvato nel file temporaneo di spool
+    """
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+@asynccontextmanager
+async def open_excel_upload(file: UploadFile) -> AsyncIterator[pd.DataFrame]:
+    """
+    Legge il file Excel caricato riservando memoria per l'upload e per il DataFrame.
+    Il file di spool viene passato direttamente a pandas senza copie in memoria.
+
+    La memoria del DataFrame viene stimata e prenotata insieme all'upload prima
+    della lettura, poi corretta con la dimensione misurata senza nuove attese.
+    """
+    size = _upload_size(file)
+    if size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail=_too_large_detail())
+
+    # Un file grande può occupare al massimo l'intero budget (e viene elaborato da solo)
+    reserved = min(int(size * (1 + DATAFRAME_EXPANSION_FACTOR)), memory_budget.capacity)
+    await memory_budget.acquire(reserved)
+    try:
+        file.file.seek(0)
+        df = await run_in_threadpool(pd.read_excel, file.file)
+
+        measured = size + int(df.memory_usage(deep=True).sum())
+        await memory_budget.resize(reserved, measured)
+        reserved = measured
+
+        yield df
+    finally:
+        await memory_budget.release(reserved)
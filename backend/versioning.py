@@ -0,0 +1,577 @@
+import json
+import os
+import re
+import tempfile
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis import convert_numpy_types
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Cartella in cui vengono salvati gli stati aggregati dei dataset versionati
+DATASETS_DIR = os.environ.get(
+    "STATLY_DATASETS_DIR",
+    os.path.join(os.path.dirname(__file__), "datasets")
+)
+
+DATASET_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Numero massimo di posizioni di righe modificate riportate nel diff
+MAX_REPORTED_ROWS = 100
+
+# Numero massimo di valori distinti conservati nello stato per ogni colonna categorica
+MAX_CATEGORICAL_VALUES = int(os.environ.get("STATLY_MAX_CATEGORICAL_VALUES", "1000"))
+
+
+def validate_dataset_name(name: str) -> bool:
+    """
+    Verifica che il nome del dataset sia utilizzabile come nome di file
+    """
+    return bool(DATASET_NAME_PATTERN.match(name))
+
+
+def _state_path(name: str) -> str:
+    return os.path.join(DATASETS_DIR, f"{name}.json")
+
+
+def _hashes_path(name: str, version: int) -> str:
+    # Nome univoco: il file della versione precedente resta valido finché il JSON non viene sostituito
+    return os.path.join(DATASETS_DIR, f"{name}.v{version}-{uuid.uuid4().hex}.npy")
+
+
+@contextmanager
+def _dataset_lock(name: str):
+    """
+    Lock esclusivo tra processi su un dataset, da tenere per tutta la sequenza
+    lettura -> calcolo -> salvataggio
+    """
+    os.makedirs(DATASETS_DIR, exist_ok=True)
+    with open(os.path.join(DATASETS_DIR, f"{name}.lock"), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _atomic_write(path: str, write):
+    """
+    Scrive su un file temporaneo nella stessa cartella e lo sostituisce atomicamente
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_dataset_state(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Carica lo stato aggregato e le impronte delle righe dell'ultima versione.
+    Se le impronte mancano o non corrispondono al numero di righe, lo stato viene
+    marcato come non utilizzabile per l'aggiornamento incrementale.
+    """
+    state_path = _state_path(name)
+    if not os.path.exists(state_path):
+        return None
+
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+
+    hashes_path = os.path.join(DATASETS_DIR, state.get('row_hashes_file', ''))
+    if state.get('row_hashes_file') and os.path.exists(hashes_path):
+        state['row_hashes'] = np.load(hashes_path)
+    else:
+        state['row_hashes'] = np.array([], dtype=np.uint64)
+    state['consistent'] = len(state['row_hashes']) == state['rows']
+    return state
+
+
+def save_dataset_state(name: str, state: Dict[str, Any], previous_hashes_file: Optional[str] = None):
+    """
+    Salva le impronte delle righe (NumPy) e poi lo stato aggregato (JSON) che le
+    riferisce. La sostituzione del JSON rende visibile la nuova versione, per cui
+    un'interruzione tra le due scritture lascia valida la versione precedente.
+    Va chiamata tenendo _dataset_lock.
+    """
+    os.makedirs(DATASETS_DIR, exist_ok=True)
+    hashes_path = _hashes_path(name, state['version'])
+    _atomic_write(hashes_path, lambda f: np.save(f, state['row_hashes']))
+
+    serializable = {key: value for key, value in state.items() if key != 'row_hashes'}
+    serializable['row_hashes_file'] = os.path.basename(hashes_path)
+    payload = json.dumps(convert_numpy_types(serializable)).encode("utf-8")
+    _atomic_write(_state_path(name), lambda f: f.write(payload))
+
+    # Rimuove solo le impronte riferite dalla versione precedente
+    if previous_hashes_file:
+        try:
+            os.remove(os.path.join(DATASETS_DIR, previous_hashes_file))
+        except FileNotFoundError:
+            pass
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Calcola un'impronta per ogni riga, indipendente dall'indice.
+    Le colonne numeriche vengono convertite in float64 prima dell'hash: una colonna
+    intera che riceve celle vuote viene letta come float e le righe già presenti
+    devono mantenere la stessa impronta.
+    """
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    normalized = df.astype({col: np.float64 for col in numeric_cols})
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def split_columns(df: pd.DataFrame) -> Tuple[List[str], List[str]]:
+    """
+    Colonne numeriche e categoriche, con la stessa classificazione di basic_statistics
+    """
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+    return numeric_cols, categorical_cols
+
+
+def numeric_aggregates(df: pd.DataFrame, columns: List[str], shift: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Calcola gli aggregati combinabili per le colonne numeriche.
+
+    Per ogni coppia di colonne (i, j) vengono considerate solo le righe in cui
+    entrambi i valori sono presenti, come fa DataFrame.corr():
+    n[i, j], sum_x[i, j] = somma di x_i, sum_xx[i, j] = somma di x_i^2 e
+    sum_xy[i, j] = somma di x_i * x_j. I valori sono traslati di `shift` per
+    limitare la perdita di precisione nelle somme dei quadrati.
+    """
+    values = df[columns].to_numpy(dtype=np.float64) - shift
+    present = ~np.isnan(values)
+    mask = present.astype(np.float64)
+    filled = np.where(present, values, 0.0)
+
+    return {
+        'n': mask.T @ mask,
+        'sum_x': filled.T @ mask,
+        'sum_xx': (filled ** 2).T @ mask,
+        'sum_xy': filled.T @ filled,
+        'min': df[columns].min().to_numpy(dtype=np.float64),
+        'max': df[columns].max().to_numpy(dtype=np.float64)
+    }
+
+
+def merge_numeric_aggregates(left: Dict[str, np.ndarray], right: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Unisce due insiemi di aggregati calcolati sulle stesse colonne e con la stessa traslazione
+    """
+    return {
+        'n': left['n'] + right['n'],
+        'sum_x': left['sum_x'] + right['sum_x'],
+        'sum_xx': left['sum_xx'] + right['sum_xx'],
+        'sum_xy': left['sum_xy'] + right['sum_xy'],
+        'min': np.fmin(left['min'], right['min']),
+        'max': np.fmax(left['max'], right['max'])
+    }
+
+
+def _json_value(value: Any) -> Any:
+    value = convert_numpy_types(value)
+    return value if isinstance(value, (bool, int, float, str)) else str(value)
+
+
+def categorical_counts(df: pd.DataFrame, columns: List[str]) -> Tuple[Dict[str, Dict[str, int]], Dict[str, Dict[str, Any]]]:
+    """
+    Frequenze dei valori per le colonne categoriche (combinabili per somma), indicizzate
+    per rappresentazione testuale, e il valore originale corrispondente a ogni chiave.
+    Le colonne con più di MAX_CATEGORICAL_VALUES valori distinti vengono troncate, vedi truncate_counts.
+    """
+    counts = {}
+    values = {}
+    for col in columns:
+        # Valori diversi con la stessa rappresentazione testuale (es. 1 e "1") vengono sommati
+        column_counts = Counter()
+        column_values = {}
+        for value, count in df[col].value_counts().items():
+            column_counts[str(value)] += int(count)
+            column_values.setdefault(str(value), _json_value(value))
+        counts[col] = dict(column_counts)
+        values[col] = column_values
+    return counts, values
+
+
+def truncate_counts(counts: Dict[str, Dict[str, int]],
+                    values: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, int]], Dict[str, Dict[str, Any]], List[str]]:
+    """
+    Limita lo stato alle MAX_CATEGORICAL_VALUES frequenze più alte di ogni colonna.
+    Restituisce anche le colonne troncate, le cui statistiche diventano approssimate:
+    i conteggi sono un limite inferiore e unique_values conta solo i valori conservati.
+    """
+    truncated = {}
+    truncated_values = {}
+    approximate = []
+    for col, column_counts in counts.items():
+        if len(column_counts) > MAX_CATEGORICAL_VALUES:
+            truncated[col] = dict(Counter(column_counts).most_common(MAX_CATEGORICAL_VALUES))
+            approximate.append(col)
+        else:
+            truncated[col] = column_counts
+        truncated_values[col] = {key: values[col].get(key, key) for key in truncated[col]}
+    return truncated, truncated_values, approximate
+
+
+def merge_categorical_counts(left: Dict[str, Dict[str, int]], right: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+    merged = {}
+    for col, counts in left.items():
+        total = Counter(counts)
+        total.update(right.get(col, {}))
+        merged[col] = dict(total)
+    return merged
+
+
+def merge_categorical_values(left: Dict[str, Dict[str, Any]], right: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    # A parità di chiave resta il valore visto per primo
+    return {col: {**right.get(col, {}), **left.get(col, {})} for col in {**left, **right}}
+
+
+def most_frequent_value(counts: Dict[str, int], values: Dict[str, Any]) -> Any:
+    """
+    Valore più frequente con la stessa scelta di Series.mode().iloc[0] a parità di frequenza
+    """
+    if not counts:
+        return None
+    top = max(counts.values())
+    tied = [values.get(key, key) for key, count in counts.items() if count == top]
+    return pd.Series(tied, dtype=object).mode().iloc[0]
+
+
+def build_aggregate_state(df: pd.DataFrame, numeric_cols: List[str], categorical_cols: List[str],
+                          shift: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Costruisce lo stato aggregato a partire da un DataFrame completo o da un blocco di righe
+    """
+    if shift is None:
+        # La traslazione è il primo valore presente di ogni colonna e resta fissa tra le versioni
+        shift = np.array([
+            float(df[col].dropna().iloc[0]) if df[col].notna().any() else 0.0
+            for col in numeric_cols
+        ], dtype=np.float64)
+
+    categorical, categorical_values, approximate = truncate_counts(*categorical_counts(df, categorical_cols))
+    return {
+        'null_counts': {col: int(df[col].isnull().sum()) for col in df.columns},
+        'numeric_shift': shift,
+        'numeric': numeric_aggregates(df, numeric_cols, shift),
+        'categorical': categorical,
+        'categorical_values': categorical_values,
+        'categorical_approximate': approximate
+    }
+
+
+def merge_aggregate_state(previous: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    categorical, categorical_values, truncated = truncate_counts(
+        merge_categorical_counts(previous['categorical'], delta['categorical']),
+        merge_categorical_values(previous['categorical_values'], delta['categorical_values'])
+    )
+    approximate = set(previous['categorical_approximate']) | set(delta['categorical_approximate']) | set(truncated)
+    return {
+        'null_counts': {
+            col: previous['null_counts'].get(col, 0) + delta['null_counts'].get(col, 0)
+            for col in previous['null_counts']
+        },
+        'numeric_shift': previous['numeric_shift'],
+        'numeric': merge_numeric_aggregates(previous['numeric'], delta['numeric']),
+        'categorical': categorical,
+        'categorical_values': categorical_values,
+        'categorical_approximate': [col for col in categorical if col in approximate]
+    }
+
+
+def _finite_or_none(value) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def statistics_from_state(df: pd.DataFrame, state: Dict[str, Any], numeric_cols: List[str],
+                          categorical_cols: List[str]) -> Dict[str, Any]:
+    """
+    Ricava le statistiche descrittive dallo stato aggregato, nello stesso formato di basic_statistics.
+    I quartili non sono combinabili e vengono calcolati direttamente sulle colonne.
+    """
+    stats = {
+        'dataset_info': {
+            'total_rows': int(len(df)),
+            'total_columns': int(len(df.columns)),
+            'missing_values': dict(state['null_counts']),
+            'memory_usage': f"{df.memory_usage(deep=True).sum() / 1024:.2f} KB"
+        }
+    }
+
+    if numeric_cols:
+        agg = state['numeric']
+        shift = state['numeric_shift']
+        n = np.diag(agg['n'])
+        sum_x = np.diag(agg['sum_x'])
+        sum_xx = np.diag(agg['sum_xx'])
+        quantiles = df[numeric_cols].quantile([0.25, 0.5, 0.75])
+
+        stats['numeric_summary'] = {}
+        for i, col in enumerate(numeric_cols):
+            count = int(n[i])
+            mean = shift[i] + sum_x[i] / count if count > 0 else np.nan
+            if count > 1:
+                variance = max((sum_xx[i] - sum_x[i] ** 2 / count) / (count - 1), 0.0)
+                std = np.sqrt(variance)
+            else:
+                std = np.nan
+            stats['numeric_summary'][col] = {
+                'count': count,
+                'mean': _finite_or_none(mean),
+                'std': _finite_or_none(std),
+                'min': _finite_or_none(agg['min'][i]),
+                '25%': _finite_or_none(quantiles.loc[0.25, col]),
+                '50%': _finite_or_none(quantiles.loc[0.5, col]),
+                '75%': _finite_or_none(quantiles.loc[0.75, col]),
+                'max': _finite_or_none(agg['max'][i])
+            }
+
+        if len(numeric_cols) >= 2:
+            corr_matrix = correlation_matrix(agg)
+            stats['correlations'] = {}
+            for i, col1 in enumerate(numeric_cols):
+                stats['correlations'][col1] = {}
+                for j, col2 in enumerate(numeric_cols):
+                    stats['correlations'][col1][col2] = _finite_or_none(corr_matrix[i, j])
+
+    if categorical_cols:
+        stats['categorical_summary'] = {}
+        for col in categorical_cols:
+            counts = pd.Series(state['categorical'][col], dtype=np.int64).sort_values(ascending=False, kind='stable')
+            stats['categorical_summary'][col] = {
+                'unique_values': int(len(counts)),
+                'most_frequent': most_frequent_value(state['categorical'][col], state['categorical_values'].get(col, {})),
+                'value_counts': {str(k): int(v) for k, v in counts.head(5).items()},
+                'approximate': col in state['categorical_approximate']
+            }
+
+    return stats
+
+
+def correlation_matrix(agg: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Correlazione di Pearson sulle coppie di osservazioni complete, a partire dai co-momenti
+    """
+    n = agg['n']
+    sum_x = agg['sum_x']
+    sum_y = agg['sum_x'].T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * agg['sum_xy'] - sum_x * sum_y
+        var_x = n * agg['sum_xx'] - sum_x ** 2
+        var_y = n * agg['sum_xx'].T - sum_y ** 2
+        corr = cov / np.sqrt(var_x * var_y)
+
+    corr[(n < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+    diagonal = np.isfinite(np.diag(corr))
+    np.fill_diagonal(corr, np.where(diagonal, 1.0, np.nan))
+    return corr
+
+
+def detect_row_changes(previous_hashes: np.ndarray, new_hashes: np.ndarray) -> Dict[str, Any]:
+    """
+    Confronta le impronte riga per riga: righe modificate, aggiunte in coda o rimosse
+    """
+    common = min(len(previous_hashes), len(new_hashes))
+    changed = np.flatnonzero(previous_hashes[:common] != new_hashes[:common])
+    return {
+        'changed_positions': changed,
+        'appended_rows': max(len(new_hashes) - len(previous_hashes), 0),
+        'removed_rows': max(len(previous_hashes) - len(new_hashes), 0)
+    }
+
+
+def build_diff_report(previous: Optional[Dict[str, Any]], current: Dict[str, Any],
+                      changes: Optional[Dict[str, Any]], mode: str) -> Dict[str, Any]:
+    """
+    Confronta le statistiche della nuova versione con quelle della versione precedente.
+    Se le variazioni delle righe non sono note (changes è None) i relativi campi valgono None.
+    """
+    report = {
+        'mode': mode,
+        'previous_version': previous['version'] if previous else None,
+        'version': current['version'],
+        'rows_before': previous['rows'] if previous else 0,
+        'rows_after': current['rows'],
+        'appended_rows': None,
+        'changed_rows': None,
+        'changed_row_positions': None,
+        'removed_rows': None,
+        'added_columns': [],
+        'removed_columns': [],
+        'numeric_changes': {},
+        'correlation_changes': [],
+        'approximate_categorical_columns': list(current['categorical_approximate'])
+    }
+
+    if changes is not None:
+        changed = changes['changed_positions']
+        report['appended_rows'] = int(changes['appended_rows'])
+        report['changed_rows'] = int(len(changed))
+        report['changed_row_positions'] = [int(pos) for pos in changed[:MAX_REPORTED_ROWS]]
+        report['removed_rows'] = int(changes['removed_rows'])
+
+    if previous is None:
+        return report
+
+    report['added_columns'] = [col for col in current['columns'] if col not in previous['columns']]
+    report['removed_columns'] = [col for col in previous['columns'] if col not in current['columns']]
+
+    before_stats = previous['statistics'].get('numeric_summary', {})
+    after_stats = current['statistics'].get('numeric_summary', {})
+    for col, after in after_stats.items():
+        before = before_stats.get(col)
+        if before is None:
+            continue
+        report['numeric_changes'][col] = {
+            key: {
+                'before': before[key],
+                'after': after[key],
+                'delta': after[key] - before[key] if before[key] is not None and after[key] is not None else None
+            }
+            for key in ('count', 'mean', 'std', 'min', 'max')
+        }
+
+    before_corr = previous['statistics'].get('correlations', {})
+    after_corr = current['statistics'].get('correlations', {})
+    columns = list(after_corr.keys())
+    for i, col1 in enumerate(columns):
+        for col2 in columns[i + 1:]:
+            before = before_corr.get(col1, {}).get(col2)
+            after = after_corr[col1][col2]
+            if col2 not in before_corr.get(col1, {}):
+                continue
+            report['correlation_changes'].append({
+                'columns': [col1, col2],
+                'before': before,
+                'after': after,
+                'delta': after - before if before is not None and after is not None else None
+            })
+
+    return report
+
+
+def update_dataset(name: str, df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Registra una nuova versione del dataset aggiornando le statistiche in modo incrementale.
+
+    Se le righe già note sono invariate e le colonne coincidono, vengono aggregate solo
+    le righe aggiunte in coda; altrimenti lo stato viene ricostruito dalla nuova versione.
+    """
+    df = df.set_axis([str(col) for col in df.columns], axis=1)
+    numeric_cols, categorical_cols = split_columns(df)
+    hashes = row_hashes(df)
+
+    with _dataset_lock(name):
+        previous = load_dataset_state(name)
+        if previous is None:
+            mode = 'initial'
+            changes = detect_row_changes(np.array([], dtype=np.uint64), hashes)
+        else:
+            if previous['consistent']:
+                changes = detect_row_changes(previous['row_hashes'], hashes)
+            else:
+                # Impronte mancanti o non valide: le variazioni delle righe non sono note
+                changes = None
+            same_schema = (
+                previous['columns'] == df.columns.tolist()
+                and previous['numeric_columns'] == numeric_cols
+                and previous['categorical_columns'] == categorical_cols
+            )
+            unchanged_rows = (
+                changes is not None
+                and len(changes['changed_positions']) == 0
+                and changes['removed_rows'] == 0
+            )
+            incremental = same_schema and unchanged_rows
+            mode = 'incremental' if incremental else 'full'
+
+        if mode == 'incremental':
+            aggregates = {
+                'null_counts': previous['null_counts'],
+                'numeric_shift': np.asarray(previous['numeric_shift'], dtype=np.float64),
+                'numeric': {key: np.asarray(value, dtype=np.float64) for key, value in previous['numeric'].items()},
+                'categorical': previous['categorical'],
+                'categorical_values': previous.get('categorical_values', {}),
+                'categorical_approximate': previous.get('categorical_approximate', [])
+            }
+            appended = df.iloc[previous['rows']:]
+            if len(appended) > 0:
+                delta = build_aggregate_state(appended, numeric_cols, categorical_cols, aggregates['numeric_shift'])
+                aggregates = merge_aggregate_state(aggregates, delta)
+        else:
+            aggregates = build_aggregate_state(df, numeric_cols, categorical_cols)
+
+        state = {
+            'name': name,
+            'version': previous['version'] + 1 if previous else 1,
+            'updated_at': datetime.now().isoformat(),
+            'rows': int(len(df)),
+            'columns': df.columns.tolist(),
+            'numeric_columns': numeric_cols,
+            'categorical_columns': categorical_cols,
+            **aggregates,
+            'row_hashes': hashes
+        }
+        state['statistics'] = convert_numpy_types(
+            statistics_from_state(df, aggregates, numeric_cols, categorical_cols)
+        )
+
+        diff = build_diff_report(previous, state, changes, mode)
+        save_dataset_state(name, state, previous.get('row_hashes_file') if previous else None)
+
+    return convert_numpy_types({
+        'dataset': name,
+        'version': state['version'],
+        'updated_at': state['updated_at'],
+        'statistics': state['statistics'],
+        'diff': diff
+    })
+
+
+def get_dataset_summary(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Restituisce le statistiche dell'ultima versione salvata del dataset
+    """
+    if not os.path.exists(_state_path(name)):
+        return None
+
+    with _dataset_lock(name):
+        state = load_dataset_state(name)
+    if state is None:
+        return None
+
+    return {
+        'dataset': name,
+        'version': state['version'],
+        'updated_at': state['updated_at'],
+        'rows': state['rows'],
+        'columns': state['columns'],
+        'statistics': state['statistics']
+    }